@@ -1,11 +1,16 @@
 """Database Operations - SQLite状态追踪"""
 
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Set, Tuple
 from dataclasses import dataclass
 
+# 绑定为模块级名称，行循环中省去属性查找
+_fromiso = datetime.fromisoformat
+
 
 @dataclass
 class ProcessedEpisode:
@@ -36,14 +41,89 @@ class PendingEpisode:
 class Database:
     """SQLite 数据库管理"""
     
+    # 热点语句固定为常量，配合连接级语句缓存只需预编译一次
+    _Q_PROCESSED = "SELECT 1 FROM processed_episodes WHERE episode_id = ? AND channel = ? AND status = 'success'"
+    _Q_PENDING = 'SELECT 1 FROM pending_episodes WHERE episode_id = ? AND channel = ?'
+    # UPSERT：冲突时原地更新且仅在内容变化时写入，避免 REPLACE 的删除+插入
+    _Q_MARK_PROCESSED = '''
+        INSERT INTO processed_episodes 
+        (episode_id, channel, title, output_path, status, processed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(episode_id, channel) DO UPDATE SET
+            title = excluded.title,
+            output_path = excluded.output_path,
+            status = excluded.status,
+            processed_at = excluded.processed_at
+        WHERE processed_episodes.status IS NOT excluded.status
+           OR processed_episodes.output_path IS NOT excluded.output_path
+           OR processed_episodes.title IS NOT excluded.title
+    '''
+    _Q_MARK_PENDING = '''
+        INSERT INTO pending_episodes 
+        (episode_id, channel, title, audio_url, transcription_id, submitted_at, published, duration)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(episode_id, channel) DO UPDATE SET
+            title = excluded.title,
+            audio_url = excluded.audio_url,
+            transcription_id = excluded.transcription_id,
+            submitted_at = excluded.submitted_at,
+            published = excluded.published,
+            duration = excluded.duration
+        WHERE pending_episodes.transcription_id IS NOT excluded.transcription_id
+           OR pending_episodes.title IS NOT excluded.title
+           OR pending_episodes.audio_url IS NOT excluded.audio_url
+           OR pending_episodes.published IS NOT excluded.published
+           OR pending_episodes.duration IS NOT excluded.duration
+    '''
+    _Q_REMOVE_PENDING = 'DELETE FROM pending_episodes WHERE episode_id = ? AND channel = ?'
+    # 显式列顺序，与 ProcessedEpisode / PendingEpisode 字段顺序一致，按元组位置解包
+    _PROCESSED_COLUMNS = 'id, episode_id, channel, title, processed_at, status, output_path'
+    _PENDING_COLUMNS = ('id, episode_id, channel, title, audio_url, transcription_id, '
+                        'submitted_at, published, duration')
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        # 长连接：避免每次调用重新打开文件、重建schema缓存和PRAGMA
+        self._lock = threading.Lock()
+        self._conn = self._connect()
         self._init_db()
     
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开连接并应用连接级 PRAGMA"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               cached_statements=256)
+        if self.db_path != ':memory:':
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA mmap_size=268435456')
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """串行化写事务：BEGIN IMMEDIATE ... COMMIT，异常时回滚"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+    
     def _init_db(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        # WAL 模式：写入不阻塞读取，每次提交只需顺序追加日志（设置后持久保存在库文件中）
+        if self.db_path != ':memory:':
+            with self._lock:
+                self._conn.execute('PRAGMA journal_mode=WAL')
+        
+        with self._transaction() as conn:
             # 已处理表
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS processed_episodes (
@@ -61,6 +141,11 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_episode_channel 
                 ON processed_episodes(episode_id, channel)
             ''')
+            # 覆盖索引：统计查询可直接从索引完成 GROUP BY/COUNT
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_channel_status 
+                ON processed_episodes(channel, status)
+            ''')
             
             # 待处理表（异步任务）
             conn.execute('''
@@ -81,66 +166,42 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_pending_channel 
                 ON pending_episodes(episode_id, channel)
             ''')
-            conn.commit()
     
     # === 已处理记录 ===
     
     def is_processed(self, episode_id: str, channel: str) -> bool:
         """检查节目是否已处理"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                'SELECT 1 FROM processed_episodes WHERE episode_id = ? AND channel = ? AND status = ?',
-                (episode_id, channel, 'success')
-            )
+        with self._lock:
+            cursor = self._conn.execute(self._Q_PROCESSED, (episode_id, channel))
             return cursor.fetchone() is not None
     
     def mark_processed(self, episode_id: str, channel: str, title: str, 
                        output_path: str, status: str = 'success'):
         """标记节目为已处理"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO processed_episodes 
-                (episode_id, channel, title, output_path, status, processed_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (episode_id, channel, title, output_path, status, datetime.now()))
-            conn.commit()
+        with self._transaction() as conn:
+            conn.execute(self._Q_MARK_PROCESSED, (episode_id, channel, title, output_path, status, datetime.now()))
     
     def get_failed_episodes(self, channel: Optional[str] = None) -> List[ProcessedEpisode]:
         """获取失败的节目列表"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            if channel:
-                cursor = conn.execute(
-                    'SELECT * FROM processed_episodes WHERE status = ? AND channel = ?',
-                    ('failed', channel)
-                )
-            else:
-                cursor = conn.execute(
-                    'SELECT * FROM processed_episodes WHERE status = ?',
-                    ('failed',)
-                )
+        sql = f'SELECT {self._PROCESSED_COLUMNS} FROM processed_episodes WHERE status = ?'
+        params = ('failed',)
+        if channel:
+            sql += ' AND channel = ?'
+            params += (channel,)
+        
+        with self._lock:
             return [
-                ProcessedEpisode(
-                    id=row['id'],
-                    episode_id=row['episode_id'],
-                    channel=row['channel'],
-                    title=row['title'],
-                    processed_at=datetime.fromisoformat(row['processed_at']),
-                    status=row['status'],
-                    output_path=row['output_path']
-                )
-                for row in cursor.fetchall()
+                ProcessedEpisode(id_, episode_id, ch, title, _fromiso(processed_at), status, output_path)
+                for id_, episode_id, ch, title, processed_at, status, output_path
+                in self._conn.execute(sql, params)
             ]
     
     # === 待处理记录（异步任务）===
     
     def is_pending(self, episode_id: str, channel: str) -> bool:
         """检查节目是否正在处理中"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                'SELECT 1 FROM pending_episodes WHERE episode_id = ? AND channel = ?',
-                (episode_id, channel)
-            )
+        with self._lock:
+            cursor = self._conn.execute(self._Q_PENDING, (episode_id, channel))
             return cursor.fetchone() is not None
     
     def mark_pending(self, episode_id: str, channel: str, title: str,
@@ -148,63 +209,77 @@ class Database:
                      published: Optional[datetime] = None,
                      duration: Optional[str] = None):
         """标记节目为待处理"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO pending_episodes 
-                (episode_id, channel, title, audio_url, transcription_id, submitted_at, published, duration)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (episode_id, channel, title, audio_url, transcription_id, 
-                  datetime.now(), published, duration))
-            conn.commit()
+        with self._transaction() as conn:
+            conn.execute(self._Q_MARK_PENDING, (episode_id, channel, title, audio_url, transcription_id,
+                                                datetime.now(), published, duration))
+    
+    def mark_pending_many(self, rows: List[tuple]):
+        """
+        批量标记待处理，单个事务提交
+        
+        Args:
+            rows: 与 mark_pending 参数顺序一致的元组
+                  (episode_id, channel, title, audio_url, transcription_id, published, duration)
+        """
+        if not rows:
+            return
+        now = datetime.now()
+        with self._transaction() as conn:
+            conn.executemany(self._Q_MARK_PENDING, [(*row[:5], now, *row[5:]) for row in rows])
     
     def get_pending(self, channel: Optional[str] = None) -> List[PendingEpisode]:
         """获取所有待处理的节目"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            if channel:
-                cursor = conn.execute(
-                    'SELECT * FROM pending_episodes WHERE channel = ?',
-                    (channel,)
-                )
-            else:
-                cursor = conn.execute('SELECT * FROM pending_episodes')
-            
+        sql = f'SELECT {self._PENDING_COLUMNS} FROM pending_episodes'
+        params = ()
+        if channel:
+            sql += ' WHERE channel = ?'
+            params = (channel,)
+        
+        with self._lock:
             results = []
-            for row in cursor.fetchall():
-                published = None
-                if row['published']:
-                    try:
-                        published = datetime.fromisoformat(row['published'])
-                    except:
-                        pass
+            for (id_, episode_id, ch, title, audio_url, transcription_id,
+                 submitted_at, published, duration) in self._conn.execute(sql, params):
+                try:
+                    published = _fromiso(published) if published else None
+                except ValueError:
+                    published = None
                 
                 results.append(PendingEpisode(
-                    id=row['id'],
-                    episode_id=row['episode_id'],
-                    channel=row['channel'],
-                    title=row['title'],
-                    audio_url=row['audio_url'],
-                    transcription_id=row['transcription_id'],
-                    submitted_at=datetime.fromisoformat(row['submitted_at']),
-                    published=published,
-                    duration=row['duration']
+                    id_, episode_id, ch, title, audio_url, transcription_id,
+                    _fromiso(submitted_at), published, duration
                 ))
             return results
     
     def remove_pending(self, episode_id: str, channel: str):
         """移除待处理记录"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                'DELETE FROM pending_episodes WHERE episode_id = ? AND channel = ?',
-                (episode_id, channel)
-            )
-            conn.commit()
+        with self._transaction() as conn:
+            conn.execute(self._Q_REMOVE_PENDING, (episode_id, channel))
+    
+    def get_known_ids(self, channel: str, episode_ids: List[str]) -> Tuple[Set[str], Set[str]]:
+        """获取给定节目中(已成功处理, 待处理)的ID集合，只查询传入的ID"""
+        if not episode_ids:
+            return set(), set()
+        # 走 UNIQUE(episode_id, channel) 索引逐个查找，不扫描整个频道
+        placeholders = ', '.join('?' * len(episode_ids))
+        params = (channel, *episode_ids)
+        with self._lock:
+            processed = {row[0] for row in self._conn.execute(
+                "SELECT episode_id FROM processed_episodes "
+                f"WHERE channel = ? AND status = 'success' AND episode_id IN ({placeholders})",
+                params
+            )}
+            pending = {row[0] for row in self._conn.execute(
+                f'SELECT episode_id FROM pending_episodes WHERE channel = ? AND episode_id IN ({placeholders})',
+                params
+            )}
+            return processed, pending
     
     # === 统计 ===
     
     def get_stats(self) -> dict:
         """获取处理统计"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            conn = self._conn
             stats = {'processed': {}, 'pending': 0}
             
             # 已处理统计
@@ -213,11 +288,9 @@ class Database:
                 FROM processed_episodes 
                 GROUP BY channel, status
             ''')
-            for row in cursor.fetchall():
-                channel, status, count = row
-                if channel not in stats['processed']:
-                    stats['processed'][channel] = {'success': 0, 'failed': 0}
-                stats['processed'][channel][status] = count
+            processed = stats['processed']
+            for channel, status, count in cursor:
+                processed.setdefault(channel, {'success': 0, 'failed': 0})[status] = count
             
             # 待处理数量
             cursor = conn.execute('SELECT COUNT(*) FROM pending_episodes')
@@ -230,3 +303,4 @@ if __name__ == '__main__':
     db = Database('./data/podcast.db')
     print("Database initialized")
     print("Stats:", db.get_stats())
+    db.close()
@@ -6,17 +6,19 @@ Query - 查询转录任务状态并下载结果
 
 import os
 import sys
-import json
 import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+import ijson
 
 from db import Database
-from transcriber import TranscriptSegment, segments_to_markdown, segments_to_json
-from utils import get_output_path, format_duration, ensure_dir
+from transcriber import TranscriptSegment, parse_duration, segments_to_markdown, segments_to_json
+from utils import get_output_path, format_duration, ensure_dir, json_dumps
 
 # 配置日志
 logging.basicConfig(
@@ -30,13 +32,23 @@ ROOT_DIR = Path(__file__).parent.parent
 OUTPUT_DIR = ROOT_DIR / 'output'
 DB_PATH = ROOT_DIR / 'data' / 'podcast.db'
 
+# 并发查询任务状态的线程数
+MAX_WORKERS = 16
+
+# 后台删除Azure上已完成的任务，不阻塞主流程（main结束前等待全部完成）
+_DELETE_POOL = ThreadPoolExecutor(max_workers=4)
+
+# 共享HTTP会话：保持连接复用，避免每个请求重新握手TCP+TLS
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
 
 def check_transcription_status(transcription_id: str, speech_key: str, speech_region: str) -> dict:
     """检查转录任务状态"""
     base_url = f"https://{speech_region}.api.cognitive.microsoft.com"
     headers = {"Ocp-Apim-Subscription-Key": speech_key}
     
-    response = requests.get(
+    response = _SESSION.get(
         f"{base_url}/speechtotext/v3.1/transcriptions/{transcription_id}",
         headers=headers,
         timeout=30
@@ -50,7 +62,7 @@ def get_transcription_result(transcription_id: str, speech_key: str, speech_regi
     base_url = f"https://{speech_region}.api.cognitive.microsoft.com"
     headers = {"Ocp-Apim-Subscription-Key": speech_key}
     
-    response = requests.get(
+    response = _SESSION.get(
         f"{base_url}/speechtotext/v3.1/transcriptions/{transcription_id}/files",
         headers=headers,
         timeout=30
@@ -59,28 +71,27 @@ def get_transcription_result(transcription_id: str, speech_key: str, speech_regi
     files = response.json()
     
     segments = []
+    # 热循环内使用局部别名，减少全局/属性查找
+    append = segments.append
+    segment = TranscriptSegment
+    parse = parse_duration
     for file in files.get("values", []):
         if file["kind"] == "Transcription":
             result_url = file["links"]["contentUrl"]
-            result_response = requests.get(result_url, timeout=60)
-            result_response.raise_for_status()
-            result = result_response.json()
-            
-            for item in result.get("recognizedPhrases", []):
-                offset = parse_duration(item.get("offset", "PT0S"))
-                duration = parse_duration(item.get("duration", "PT0S"))
-                speaker = item.get("speaker", 0)
-                
-                best = item.get("nBest", [{}])[0]
-                text = best.get("display", "")
+            # 流式解析结果JSON，边下载边处理，内存中只保留单条phrase
+            with _SESSION.get(result_url, stream=True, timeout=60) as result_response:
+                result_response.raise_for_status()
+                result_response.raw.decode_content = True
                 
-                if text:
-                    segments.append(TranscriptSegment(
-                        start_time=offset,
-                        end_time=offset + duration,
-                        text=text,
-                        speaker=speaker
-                    ))
+                for item in ijson.items(result_response.raw, 'recognizedPhrases.item', use_float=True):
+                    # 先过滤空文本，避免无用的时长解析
+                    text = (item.get("nBest") or [{}])[0].get("display", "")
+                    if not text:
+                        continue
+                    
+                    offset = parse(item.get("offset", "PT0S"))
+                    duration = parse(item.get("duration", "PT0S"))
+                    append(segment(offset, offset + duration, text, item.get("speaker", 0)))
     
     return segments
 
@@ -90,31 +101,22 @@ def delete_transcription(transcription_id: str, speech_key: str, speech_region:
     base_url = f"https://{speech_region}.api.cognitive.microsoft.com"
     headers = {"Ocp-Apim-Subscription-Key": speech_key}
     
-    requests.delete(
+    _SESSION.delete(
         f"{base_url}/speechtotext/v3.1/transcriptions/{transcription_id}",
         headers=headers,
         timeout=30
     )
 
 
-def parse_duration(duration_str: str) -> float:
-    """解析 ISO 8601 duration"""
-    if not duration_str or not duration_str.startswith("PT"):
-        return 0.0
-    
-    duration_str = duration_str[2:]
-    total = 0.0
+def delete_transcription_async(transcription_id: str, speech_key: str, speech_region: str):
+    """在后台线程删除转录任务，失败时记录日志（任务会遗留在Azure上）"""
+    future = _DELETE_POOL.submit(delete_transcription, transcription_id, speech_key, speech_region)
     
-    if "H" in duration_str:
-        hours, duration_str = duration_str.split("H")
-        total += float(hours) * 3600
-    if "M" in duration_str:
-        minutes, duration_str = duration_str.split("M")
-        total += float(minutes) * 60
-    if "S" in duration_str:
-        total += float(duration_str.replace("S", ""))
+    def _log_failure(f):
+        if f.exception() is not None:
+            logger.error(f"Failed to delete transcription {transcription_id}: {f.exception()}")
     
-    return total
+    future.add_done_callback(_log_failure)
 
 
 def save_output(pending, segments):
@@ -124,7 +126,7 @@ def save_output(pending, segments):
     
     # Markdown
     md_path = str(output_base) + '.md'
-    md_lines = [
+    md_header = [
         f"# {pending.title}",
         "",
         f"- 发布日期: {date_str}",
@@ -133,10 +135,12 @@ def save_output(pending, segments):
         "",
         "## 转录内容",
         "",
-        segments_to_markdown(segments)
     ]
+    # 分段写入，避免再拼接一份完整转录文本的副本
     with open(md_path, 'w', encoding='utf-8') as f:
-        f.write("\n".join(md_lines))
+        f.write("\n".join(md_header))
+        f.write("\n")
+        f.write(segments_to_markdown(segments))
     
     # JSON
     json_path = str(output_base) + '.json'
@@ -149,8 +153,8 @@ def save_output(pending, segments):
         "transcript": segments_to_json(segments),
         "processed_at": datetime.now().isoformat()
     }
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(json_content, f, ensure_ascii=False, indent=2)
+    with open(json_path, 'wb') as f:
+        f.write(json_dumps(json_content, indent=True))
     
     return md_path
 
@@ -200,59 +204,65 @@ Examples:
     still_running = 0
     failed = 0
     
-    for pending in pending_list:
-        logger.info(f"Checking [{pending.channel}]: {pending.title[:40]}...")
+    # 并发查询状态（纯网络等待），结果处理与数据库写入留在主线程
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(check_transcription_status, p.transcription_id, speech_key, speech_region): p
+            for p in pending_list
+        }
         
-        try:
-            status = check_transcription_status(
-                pending.transcription_id,
-                speech_key,
-                speech_region
-            )
+        for future in as_completed(futures):
+            pending = futures[future]
+            logger.info(f"Checking [{pending.channel}]: {pending.title[:40]}...")
             
-            if status["status"] == "Succeeded":
-                segments = get_transcription_result(
-                    pending.transcription_id,
-                    speech_key,
-                    speech_region
-                )
+            try:
+                status = future.result()
                 
-                if segments:
-                    output_path = save_output(pending, segments)
-                    
-                    db.mark_processed(
-                        pending.episode_id,
-                        pending.channel,
-                        pending.title,
-                        output_path,
-                        'success'
+                if status["status"] == "Succeeded":
+                    segments = get_transcription_result(
+                        pending.transcription_id,
+                        speech_key,
+                        speech_region
                     )
-                    db.remove_pending(pending.episode_id, pending.channel)
-                    delete_transcription(pending.transcription_id, speech_key, speech_region)
+                
+                    if segments:
+                        output_path = save_output(pending, segments)
                     
-                    logger.info(f"  ✓ Completed: {output_path}")
-                    completed += 1
-                else:
+                        db.mark_processed(
+                            pending.episode_id,
+                            pending.channel,
+                            pending.title,
+                            output_path,
+                            'success'
+                        )
+                        db.remove_pending(pending.episode_id, pending.channel)
+                        delete_transcription_async(pending.transcription_id, speech_key, speech_region)
+                    
+                        logger.info(f"  ✓ Completed: {output_path}")
+                        completed += 1
+                    else:
+                        db.mark_processed(pending.episode_id, pending.channel, pending.title, '', 'failed')
+                        db.remove_pending(pending.episode_id, pending.channel)
+                        logger.warning(f"  ✗ No segments found")
+                        failed += 1
+                    
+                elif status["status"] == "Failed":
+                    error = status.get("properties", {}).get("error", {}).get("message", "Unknown")
+                    logger.error(f"  ✗ Failed: {error}")
                     db.mark_processed(pending.episode_id, pending.channel, pending.title, '', 'failed')
                     db.remove_pending(pending.episode_id, pending.channel)
-                    logger.warning(f"  ✗ No segments found")
+                    delete_transcription_async(pending.transcription_id, speech_key, speech_region)
                     failed += 1
-                    
-            elif status["status"] == "Failed":
-                error = status.get("properties", {}).get("error", {}).get("message", "Unknown")
-                logger.error(f"  ✗ Failed: {error}")
-                db.mark_processed(pending.episode_id, pending.channel, pending.title, '', 'failed')
-                db.remove_pending(pending.episode_id, pending.channel)
-                delete_transcription(pending.transcription_id, speech_key, speech_region)
-                failed += 1
                 
-            else:
-                logger.info(f"  ⏳ Still running: {status['status']}")
-                still_running += 1
+                else:
+                    logger.info(f"  ⏳ Still running: {status['status']}")
+                    still_running += 1
                 
-        except Exception as e:
-            logger.error(f"  ✗ Error: {e}")
-            failed += 1
+            except Exception as e:
+                logger.error(f"  ✗ Error: {e}")
+                failed += 1
+    
+    _DELETE_POOL.shutdown(wait=True)
     
     logger.info(f"\n=== Summary ===")
     logger.info(f"Completed: {completed}")
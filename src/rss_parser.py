@@ -1,10 +1,24 @@
 """RSS Feed Parser - 解析播客RSS订阅"""
 
-import feedparser
+import io
+import re
+import logging
+import requests
+import urllib3
+import xml.etree.ElementTree as ET
 from dataclasses import dataclass
-from datetime import datetime
-from typing import List, Optional
-import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from html.entities import name2codepoint as _HTML_ENTITIES
+from typing import Any, Iterator, List, Optional, Tuple
+
+ITUNES_NS = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
+
+# 命名实体引用，如 &nbsp;（按字节匹配，适用于 UTF-8 等 ASCII 兼容编码）
+_ENTITY_RE = re.compile(rb'&([A-Za-z][A-Za-z0-9]*);')
+_XML_ENTITIES = frozenset({'amp', 'lt', 'gt', 'quot', 'apos'})
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -29,48 +43,146 @@ def parse_feed(url: str, max_episodes: int = 10) -> List[Episode]:
     Returns:
         Episode列表
     """
-    feed = feedparser.parse(url)
+    return fetch_feed(url, max_episodes)[1]
+
+
+def fetch_feed(url: str, max_episodes: int = 10) -> Tuple[str, List[Episode]]:
+    """
+    下载并解析RSS订阅，一次获取频道标题和节目列表
+    
+    仅支持 RSS 2.0（<rss><channel><item>）；Atom、RSS 1.0 等格式记录警告并返回空列表
+    
+    Args:
+        url: RSS订阅地址
+        max_episodes: 最大返回数量
+        
+    Returns:
+        (频道标题, Episode列表)，标题缺失时为空字符串
+    """
+    feed_title = None
     episodes = []
     
-    for entry in feed.entries[:max_episodes]:
-        # 查找音频文件链接
-        audio_url = None
-        for link in entry.get('links', []):
-            if link.get('type', '').startswith('audio/'):
-                audio_url = link.get('href')
-                break
+    # 先流式严格解析；遇到未声明的 HTML 实体（如 &nbsp;）时整体下载、替换为字符引用后重试一次
+    for tolerant in (False, True):
+        feed_title = None
+        episodes = []
+        try:
+            with requests.get(url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                if tolerant:
+                    source = io.BytesIO(_ENTITY_RE.sub(_to_charref, response.content))
+                else:
+                    source = response.raw
+                
+                # 流式解析：凑够数量即停止，无需下载/构建整棵树
+                for kind, value in _iter_feed(source):
+                    if kind == 'title':
+                        feed_title = value
+                        continue
+                    episodes.append(value)
+                    if len(episodes) >= max_episodes:
+                        break
+        # 获取或解析失败时不抛出异常，返回已解析到的内容
+        # 流式读取 response.raw 时连接中断/读超时以 urllib3 异常抛出，不经过 requests 包装
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            logger.warning("Failed to fetch feed %s: %s", url, e)
+        except ET.ParseError as e:
+            if not tolerant and str(e).startswith('undefined entity'):
+                logger.info("Feed %s uses undeclared entities, retrying with tolerant parsing", url)
+                continue
+            logger.warning("Failed to parse feed %s: %s", url, e)
+        except ValueError as e:
+            logger.warning("Unsupported feed %s: %s", url, e)
+        else:
+            if not episodes:
+                logger.warning("No audio items found in feed %s", url)
+        break
+    
+    return feed_title or '', episodes
+
+
+def _iter_feed(source) -> Iterator[Tuple[str, Any]]:
+    """
+    流式解析RSS 2.0，依次产出 ('title', 频道标题) 和 ('item', Episode)
+    
+    Raises:
+        ET.ParseError: XML格式错误
+        ValueError: 根元素不是 <rss>
+    """
+    # 当前元素的祖先标签栈，用于判断 <title> 的父元素
+    path = []
+    title_seen = False
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if not path and elem.tag != 'rss':
+                raise ValueError(f"unsupported format <{elem.tag.rsplit('}', 1)[-1]}>, only RSS 2.0 is supported")
+            path.append(elem.tag)
+            continue
+        path.pop()
         
-        # 尝试从enclosures获取
-        if not audio_url:
-            for enclosure in entry.get('enclosures', []):
-                if enclosure.get('type', '').startswith('audio/'):
-                    audio_url = enclosure.get('href')
-                    break
+        # 频道标题：父元素为 <channel> 的 <title>（排除 <image>/<item> 内的标题）
+        if elem.tag == 'title' and not title_seen and path and path[-1] == 'channel':
+            title_seen = True
+            yield 'title', (elem.text or '').strip()
+            continue
         
-        if not audio_url:
+        if elem.tag != 'item':
             continue
-            
-        # 解析发布时间
-        published = None
-        if hasattr(entry, 'published_parsed') and entry.published_parsed:
-            published = datetime(*entry.published_parsed[:6])
-        else:
-            published = datetime.now()
-            
-        # 获取时长
-        duration = entry.get('itunes_duration')
         
-        episode = Episode(
-            id=entry.get('id', entry.get('link', audio_url)),
-            title=entry.get('title', 'Untitled'),
-            audio_url=audio_url,
-            published=published,
-            duration=duration,
-            description=entry.get('summary', '')
-        )
-        episodes.append(episode)
+        episode = _parse_item(elem)
+        elem.clear()
+        if episode:
+            yield 'item', episode
+
+
+def _to_charref(match: re.Match) -> bytes:
+    """将 HTML 命名实体替换为数字字符引用，XML 预定义实体和未知名称保持原样"""
+    name = match.group(1).decode('ascii')
+    if name in _XML_ENTITIES or name not in _HTML_ENTITIES:
+        return match.group(0)
+    return b'&#%d;' % _HTML_ENTITIES[name]
+
+
+def _parse_item(item: ET.Element) -> Optional[Episode]:
+    """将 <item> 元素转换为 Episode，没有音频时返回 None"""
+    # 查找音频文件链接
+    audio_url = None
+    for enclosure in item.iter('enclosure'):
+        if enclosure.get('type', '').startswith('audio/'):
+            audio_url = enclosure.get('url')
+            break
     
-    return episodes
+    if not audio_url:
+        return None
+    
+    # 解析发布时间（统一为UTC的naive datetime）
+    published = None
+    pub_date = _text(item, 'pubDate')
+    if pub_date:
+        try:
+            published = parsedate_to_datetime(pub_date)
+            if published.tzinfo:
+                published = published.astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            published = None
+    if not published:
+        published = datetime.now()
+    
+    return Episode(
+        id=_text(item, 'guid') or _text(item, 'link') or audio_url,
+        title=_text(item, 'title') or 'Untitled',
+        audio_url=audio_url,
+        published=published,
+        duration=_text(item, f'{ITUNES_NS}duration'),
+        description=_text(item, 'description') or _text(item, f'{ITUNES_NS}summary') or ''
+    )
+
+
+def _text(elem: ET.Element, tag: str) -> Optional[str]:
+    """读取子元素文本并去除首尾空白"""
+    text = elem.findtext(tag)
+    return text.strip() if text else None
 
 
 if __name__ == '__main__':
@@ -7,18 +7,22 @@ Submit - 异步提交转录任务
 """
 
 import os
+import re
 import sys
 import time
 import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 import requests
-import feedparser
+from requests.adapters import HTTPAdapter
 
-from rss_parser import parse_feed
+from rss_parser import fetch_feed
 from db import Database
-from utils import load_feeds
+from utils import load_feeds, json_dumps
 
 # 配置日志
 logging.basicConfig(
@@ -32,71 +36,89 @@ ROOT_DIR = Path(__file__).parent.parent
 CONFIG_PATH = ROOT_DIR / 'config' / 'channels.txt'
 DB_PATH = ROOT_DIR / 'data' / 'podcast.db'
 
+# 共享HTTP会话：保持连接复用，避免每个请求重新握手TCP+TLS
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
 
-def get_channel_name_from_rss(url: str) -> str:
-    """从RSS feed中提取频道名称"""
-    try:
-        feed = feedparser.parse(url)
-        title = feed.feed.get('title', '')
-        if title:
-            # 清理名称，移除特殊字符
-            import re
-            name = re.sub(r'[^a-zA-Z0-9\u4e00-\u9fff]+', '-', title)
-            name = name.strip('-').lower()
-            return name[:50] if name else 'unknown'
-    except:
-        pass
+# 频道名中需替换为 '-' 的字符（保留字母数字和中文）
+_CHANNEL_NAME_RE = re.compile(r'[^a-zA-Z0-9\u4e00-\u9fff]+')
+
+# 配置文件模式下并发处理的频道数
+MAX_WORKERS = 8
+
+# 转录任务的固定属性，模块加载时构建一次；各线程只读共享，每次提交只新建外层payload
+_PROPERTIES = {
+    "wordLevelTimestampsEnabled": True,
+    "punctuationMode": "DictatedAndAutomatic",
+    "profanityFilterMode": "None"
+}
+# Enable automatic language identification
+_AUTO_LANGUAGE_PROPERTIES = {
+    **_PROPERTIES,
+    "languageIdentification": {
+        "candidateLocales": ["en-US", "zh-CN", "ja-JP", "ko-KR", "de-DE", "fr-FR", "es-ES"]
+    }
+}
+
+
+def get_channel_name(feed_title: str) -> str:
+    """从RSS频道标题生成频道名称"""
+    if feed_title:
+        # 清理名称，移除特殊字符
+        name = _CHANNEL_NAME_RE.sub('-', feed_title).strip('-').lower()
+        return name[:50] if name else 'unknown'
     return 'unknown'
 
 
-def submit_transcription(audio_url: str, language: str, speech_key: str, speech_region: str) -> str:
-    """提交转录任务到Azure，返回transcription_id"""
-    base_url = f"https://{speech_region}.api.cognitive.microsoft.com"
+@lru_cache(maxsize=None)
+def _endpoint(speech_key: str, speech_region: str) -> Tuple[str, Dict[str, str]]:
+    """构建提交地址和请求头；凭据整次运行不变，只构建一次，各线程只读共享"""
+    create_url = f"https://{speech_region}.api.cognitive.microsoft.com/speechtotext/v3.1/transcriptions"
     headers = {
         "Ocp-Apim-Subscription-Key": speech_key,
         "Content-Type": "application/json"
     }
-    
-    properties = {
-        "wordLevelTimestampsEnabled": True,
-        "punctuationMode": "DictatedAndAutomatic",
-        "profanityFilterMode": "None"
-    }
+    return create_url, headers
+
+
+def submit_transcription(audio_url: str, language: str, speech_key: str, speech_region: str) -> str:
+    """提交转录任务到Azure，返回transcription_id"""
+    create_url, headers = _endpoint(speech_key, speech_region)
     
     payload = {
         "contentUrls": [audio_url],
-        "displayName": f"podcast-{int(time.time())}",
-        "properties": properties
+        "displayName": f"podcast-{time.time_ns()}",
     }
     
     # Use auto language detection if language is "auto", otherwise specify locale
     if language and language.lower() != "auto":
         payload["locale"] = language
+        payload["properties"] = _PROPERTIES
     else:
-        # Enable automatic language identification
-        properties["languageIdentification"] = {
-            "candidateLocales": ["en-US", "zh-CN", "ja-JP", "ko-KR", "de-DE", "fr-FR", "es-ES"]
-        }
+        payload["properties"] = _AUTO_LANGUAGE_PROPERTIES
     
-    response = requests.post(
-        f"{base_url}/speechtotext/v3.1/transcriptions",
+    response = _SESSION.post(
+        create_url,
         headers=headers,
-        json=payload,
+        data=json_dumps(payload),
         timeout=30
     )
     response.raise_for_status()
     
     transcription = response.json()
-    return transcription["self"].split("/")[-1]
+    return transcription["self"].rsplit("/", 1)[-1].split("?", 1)[0]
 
 
-def process_single_rss(url: str, channel_name: str, language: str, 
+def process_single_rss(url: str, channel_name: Optional[str], language: str, 
                        speech_key: str, speech_region: str, db: Database) -> int:
-    """处理单个RSS，返回提交的任务数"""
+    """处理单个RSS，返回提交的任务数；channel_name 为空时从RSS标题自动提取"""
     logger.info(f"Processing RSS: {url}")
+    
+    # 一次下载解析同时得到频道标题和最新一集
+    feed_title, episodes = fetch_feed(url, max_episodes=1)
+    channel_name = channel_name or get_channel_name(feed_title)
     logger.info(f"Channel: {channel_name}, Language: {language}")
     
-    episodes = parse_feed(url, max_episodes=1)  # 只取最新一集
     if not episodes:
         logger.warning("No episodes found")
         return 0
@@ -137,64 +159,81 @@ def process_single_rss(url: str, channel_name: str, language: str,
         return 0
 
 
+def _process_channel(url: str, speech_key: str, speech_region: str, db: Database) -> tuple:
+    """
+    处理配置文件中的单个频道（在线程池中运行，不写数据库）
+    
+    Returns:
+        (结果, pending行)，结果为 'submitted' / 'skipped' / 'error'；
+        pending行与 Database.mark_pending_many 的元组格式一致
+    """
+    try:
+        feed_title, episodes = fetch_feed(url, max_episodes=1)  # 只取最新一集
+        # 自动提取频道名
+        channel_name = get_channel_name(feed_title)
+        logger.info(f"=== Feed: {channel_name} ===")
+        
+        if not episodes:
+            logger.warning(f"No episodes found for {url}")
+            return 'error', None
+            
+        episode = episodes[0]
+        processed_ids, pending_ids = db.get_known_ids(channel_name, [episode.id])
+        
+        if episode.id in processed_ids:
+            logger.info(f"Skipping (done): {episode.title[:40]}...")
+            return 'skipped', None
+        
+        if episode.id in pending_ids:
+            logger.info(f"Skipping (pending): {episode.title[:40]}...")
+            return 'skipped', None
+        
+        try:
+            transcription_id = submit_transcription(
+                episode.audio_url, "auto", speech_key, speech_region
+            )
+        except Exception as e:
+            logger.error(f"Failed: {e}")
+            return 'error', None
+        
+        logger.info(f"Submitted: {episode.title[:40]}... -> {transcription_id}")
+        return 'submitted', (
+            episode.id, channel_name, episode.title, episode.audio_url,
+            transcription_id, episode.published, episode.duration
+        )
+            
+    except Exception as e:
+        logger.error(f"Error processing feed: {e}")
+        return 'error', None
+
+
 def process_config_file(speech_key: str, speech_region: str, db: Database) -> tuple:
     """从配置文件批量处理，返回(submitted, skipped)"""
     if not CONFIG_PATH.exists():
         logger.error(f"Config file not found: {CONFIG_PATH}")
         return 0, 0
     
-    feeds = load_feeds(str(CONFIG_PATH))
+    # 去重：并发处理时重复的URL无法通过pending表互相感知
+    feeds = list(dict.fromkeys(load_feeds(str(CONFIG_PATH))))
     logger.info(f"Loaded {len(feeds)} feeds from config")
     
     submitted = 0
     skipped = 0
+    pending_rows = []
     
-    for url in feeds:
-        # 自动提取频道名
-        channel_name = get_channel_name_from_rss(url)
-        logger.info(f"\n=== Feed: {channel_name} ===")
-        
-        try:
-            episodes = parse_feed(url, max_episodes=1)  # 只取最新一集
-            if not episodes:
-                logger.warning(f"No episodes found for {url}")
-                continue
-                
-            episode = episodes[0]
-            
-            if db.is_processed(episode.id, channel_name):
-                logger.info(f"Skipping (done): {episode.title[:40]}...")
-                skipped += 1
-                continue
-            
-            if db.is_pending(episode.id, channel_name):
-                logger.info(f"Skipping (pending): {episode.title[:40]}...")
-                skipped += 1
-                continue
-            
-            try:
-                transcription_id = submit_transcription(
-                    episode.audio_url, "auto", speech_key, speech_region
-                )
-                
-                db.mark_pending(
-                    episode_id=episode.id,
-                    channel=channel_name,
-                    title=episode.title,
-                    audio_url=episode.audio_url,
-                    transcription_id=transcription_id,
-                    published=episode.published,
-                    duration=episode.duration
-                )
-                
-                logger.info(f"Submitted: {episode.title[:40]}... -> {transcription_id}")
-                submitted += 1
-                
-            except Exception as e:
-                logger.error(f"Failed: {e}")
-                
-        except Exception as e:
-            logger.error(f"Error processing feed: {e}")
+    # 各频道的RSS下载和Azure提交都是网络等待，并发执行；数据库写入留在主线程
+    worker = partial(_process_channel, speech_key=speech_key, speech_region=speech_region, db=db)
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for result, row in executor.map(worker, feeds):
+                if result == 'submitted':
+                    pending_rows.append(row)
+                    submitted += 1
+                elif result == 'skipped':
+                    skipped += 1
+    finally:
+        # 整个批次一次性写入；中途中断也会记录已提交的任务
+        db.mark_pending_many(pending_rows)
     
     return submitted, skipped
 
@@ -241,9 +280,8 @@ Examples:
         logger.info(f"Skipped: {skipped}")
     else:
         # 模式1: 单个RSS
-        channel_name = args.name or get_channel_name_from_rss(args.url)
         submitted = process_single_rss(
-            args.url, channel_name, args.lang,
+            args.url, args.name, args.lang,
             speech_key, speech_region, db
         )
         logger.info(f"\n=== Summary ===")
@@ -1,13 +1,40 @@
 """Azure Speech Transcriber - 批量转录API (直接传URL，不下载到本地)"""
 
 import os
+import re
 import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
-from typing import List, Dict
+import ijson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Optional
 from dataclasses import dataclass
+from functools import lru_cache
 
+from utils import json_dumps, json_loads
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+
+# Azure Speech 批量转录 REST API 版本
+API_VERSION = "v3.1"
+
+# 状态轮询间隔（秒）
+POLL_INITIAL_DELAY = 1
+POLL_MAX_DELAY = 15
+# 单个转录任务的最长等待时间（秒）
+MAX_WAIT = 6 * 3600
+
+# 结果文件名 contenturl_<n>.json 中的输入URL下标
+_RESULT_NAME_RE = re.compile(r'contenturl_(\d+)\.json$')
+
+# ISO 8601 时长，如 PT1H2M3.4S
+_ISO_DURATION_RE = re.compile(r'PT(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?')
+
+
+@dataclass(slots=True, frozen=True)
 class TranscriptSegment:
     """转录片段"""
     start_time: float  # 秒
@@ -18,12 +45,29 @@ class TranscriptSegment:
 
 def format_time(seconds: float) -> str:
     """格式化时间为 HH:MM:SS"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
+    hours, rem = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rem, 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 
+@lru_cache(maxsize=4096)
+def parse_duration(duration_str: str) -> float:
+    """解析 ISO 8601 duration (PT1H2M3.4S) 为秒数"""
+    m = _ISO_DURATION_RE.match(duration_str) if duration_str else None
+    if not m:
+        return 0.0
+    hours, minutes, seconds = m.groups()
+    return float(hours or 0) * 3600 + float(minutes or 0) * 60 + float(seconds or 0)
+
+
+def _retry_after(response: requests.Response) -> float:
+    """读取 Retry-After 响应头（秒），缺失或无法解析时返回0"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except ValueError:
+        return 0.0
+
+
 class Transcriber:
     """Azure Speech 批量转录器 - 直接从URL转录MP3，不经过本地"""
     
@@ -32,6 +76,33 @@ class Transcriber:
         self.speech_region = speech_region
         self.language = "zh-CN"
         self.base_url = f"https://{speech_region}.api.cognitive.microsoft.com"
+        # API版本只在此处出现；任务相关URL由模板填入 transcription_id
+        self._create_url = f"{self.base_url}/speechtotext/{API_VERSION}/transcriptions"
+        self._tx_url_tmpl = self._create_url + "/{}"
+        # 订阅密钥只随Azure API请求发送，不作为会话默认头（结果文件是带SAS的存储URL）
+        self._headers = {
+            "Ocp-Apim-Subscription-Key": speech_key,
+            "Content-Type": "application/json"
+        }
+        # 复用连接（keep-alive），创建/轮询/获取/删除共享一次TLS握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+    
+    def close(self):
+        """关闭HTTP会话"""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def set_language(self, language: str):
         """设置识别语言"""
@@ -47,18 +118,29 @@ class Transcriber:
         Returns:
             TranscriptSegment列表
         """
+        return self.transcribe_batch([audio_url])[audio_url]
+    
+    def transcribe_batch(self, audio_urls: List[str]) -> Dict[str, List[TranscriptSegment]]:
+        """
+        在同一个转录任务中转录多个音频，只需一次创建/轮询/获取/删除
+        
+        Args:
+            audio_urls: 音频URL列表
+            
+        Returns:
+            {音频URL: TranscriptSegment列表}，只包含转录成功的音频，缺失的记录警告
+        """
+        urls = list(dict.fromkeys(audio_urls))
+        
         # 使用原始URL（Azure会处理重定向）
-        headers = {
-            "Ocp-Apim-Subscription-Key": self.speech_key,
-            "Content-Type": "application/json"
-        }
+        headers = self._headers
         
         # 1. 创建转录任务
-        create_url = f"{self.base_url}/speechtotext/v3.1/transcriptions"
+        create_url = self._create_url
         payload = {
-            "contentUrls": [audio_url],
+            "contentUrls": urls,
             "locale": self.language,
-            "displayName": f"podcast-{int(time.time())}",
+            "displayName": f"podcast-batch-{int(time.time())}",
             "properties": {
                 "wordLevelTimestampsEnabled": True,
                 "punctuationMode": "DictatedAndAutomatic",
@@ -66,118 +148,138 @@ class Transcriber:
             }
         }
         
-        response = requests.post(create_url, headers=headers, json=payload, timeout=30)
+        response = self._session.post(create_url, headers=headers, data=json_dumps(payload), timeout=30)
         response.raise_for_status()
-        transcription = response.json()
-        transcription_id = transcription["self"].split("/")[-1]
+        transcription = json_loads(response.content)
+        transcription_id = transcription["self"].rsplit("/", 1)[-1].split("?", 1)[0]
         
-        print(f"  Transcription job created: {transcription_id}")
+        logger.info(f"Transcription job created: {transcription_id}")
         
         # 2. 轮询等待完成
-        status_url = f"{self.base_url}/speechtotext/v3.1/transcriptions/{transcription_id}"
-        while True:
-            response = requests.get(status_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            status = response.json()
+        status_url = self._tx_url_tmpl.format(transcription_id)
+        try:
+            # 自适应轮询：优先使用 Retry-After，否则从1秒开始指数退避到上限
+            delay = POLL_INITIAL_DELAY
+            start_time = time.monotonic()
+            while True:
+                response = self._session.get(status_url, headers=headers, timeout=30)
+                response.raise_for_status()
+                status = json_loads(response.content)
+                
+                if status["status"] == "Succeeded":
+                    logger.info(f"Transcription completed: {transcription_id}")
+                    break
+                elif status["status"] == "Failed":
+                    error_msg = status.get("properties", {}).get("error", {}).get("message", "Unknown error")
+                    raise Exception(f"Transcription failed: {error_msg}")
+                
+                if time.monotonic() - start_time > MAX_WAIT:
+                    raise TimeoutError(f"Transcription not finished after {MAX_WAIT}s: {transcription_id}")
+                
+                logger.debug(f"Status: {status['status']}...")
+                time.sleep(_retry_after(response) or delay)
+                delay = min(POLL_MAX_DELAY, delay * 2)
             
-            if status["status"] == "Succeeded":
-                print("  Transcription completed")
-                break
-            elif status["status"] == "Failed":
-                error_msg = status.get("properties", {}).get("error", {}).get("message", "Unknown error")
-                raise Exception(f"Transcription failed: {error_msg}")
+            # 3. 获取结果
+            files_url = status_url + "/files"
+            response = self._session.get(files_url, headers=headers, timeout=30)
+            response.raise_for_status()
+            files = json_loads(response.content)
             
-            print(f"  Status: {status['status']}...")
-            time.sleep(15)
-        
-        # 3. 获取结果
-        files_url = f"{self.base_url}/speechtotext/v3.1/transcriptions/{transcription_id}/files"
-        response = requests.get(files_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        files = response.json()
-        
-        segments = []
-        for file in files.get("values", []):
-            if file["kind"] == "Transcription":
-                result_url = file["links"]["contentUrl"]
-                result_response = requests.get(result_url, timeout=60)
-                result_response.raise_for_status()
-                result = result_response.json()
-                
-                # 解析结果
-                for item in result.get("recognizedPhrases", []):
-                    offset_seconds = self._parse_duration(item.get("offset", "PT0S"))
-                    duration_seconds = self._parse_duration(item.get("duration", "PT0S"))
-                    speaker = item.get("speaker", 0)
+            # 每个音频对应一个结果文件 contenturl_<n>.json，n 为其在 contentUrls 中的下标
+            results = {}
+            for file in files.get("values", []):
+                if file["kind"] == "Transcription":
+                    m = _RESULT_NAME_RE.search(file.get("name", ""))
+                    if not m or int(m.group(1)) >= len(urls):
+                        logger.warning(f"Unmatched result file {file.get('name')!r} in {transcription_id}")
+                        continue
+                    url = urls[int(m.group(1))]
                     
-                    best = item.get("nBest", [{}])[0]
-                    text = best.get("display", "")
-                    
-                    if text:
-                        segments.append(TranscriptSegment(
-                            start_time=offset_seconds,
-                            end_time=offset_seconds + duration_seconds,
-                            text=text,
-                            speaker=speaker
-                        ))
-        
-        # 4. 清理任务
-        requests.delete(status_url, headers=headers, timeout=30)
+                    result_url = file["links"]["contentUrl"]
+                    # 流式解析结果，边下载边处理，内存中只保留单条phrase
+                    with self._session.get(result_url, stream=True, timeout=60) as result_response:
+                        result_response.raise_for_status()
+                        result_response.raw.decode_content = True
+                        
+                        # 解析结果
+                        phrases = ijson.items(result_response.raw, 'recognizedPhrases.item', use_float=True)
+                        results[url] = [seg for seg in map(_phrase_to_segment, phrases) if seg is not None]
+            
+            # 单个音频失败时任务仍为 Succeeded，只是缺少其结果文件：保留其余结果，全部缺失才报错
+            missing = [url for url in urls if url not in results]
+            if len(missing) == len(urls):
+                raise Exception(f"No transcription results in {transcription_id}")
+            for url in missing:
+                logger.warning(f"Missing transcription result for {url} in {transcription_id}")
+        finally:
+            # 4. 清理任务（成功、失败、超时都删除Azure上的任务）
+            try:
+                self._session.delete(status_url, headers=headers, timeout=30)
+            except requests.RequestException as e:
+                logger.warning(f"Failed to delete transcription {transcription_id}: {e}")
         
-        return segments
+        return results
     
-    def _resolve_url(self, url: str) -> str:
-        """解析重定向获取最终URL"""
-        try:
-            response = requests.head(url, allow_redirects=True, timeout=30)
-            return response.url
-        except:
-            return url
-    
-    def _parse_duration(self, duration_str: str) -> float:
-        """解析 ISO 8601 duration (PT1H2M3.4S) 为秒数"""
-        if not duration_str or not duration_str.startswith("PT"):
-            return 0.0
-        
-        duration_str = duration_str[2:]  # 移除 "PT"
-        total_seconds = 0.0
-        
-        # 解析小时
-        if "H" in duration_str:
-            hours, duration_str = duration_str.split("H")
-            total_seconds += float(hours) * 3600
-        
-        # 解析分钟
-        if "M" in duration_str:
-            minutes, duration_str = duration_str.split("M")
-            total_seconds += float(minutes) * 60
-        
-        # 解析秒
-        if "S" in duration_str:
-            seconds = duration_str.replace("S", "")
-            total_seconds += float(seconds)
+    def transcribe_many(self, audio_urls: List[str], max_workers: int = 4) -> Dict[str, List[TranscriptSegment]]:
+        """
+        并发转录多个音频，各任务的创建/轮询/获取互不阻塞，共享同一个HTTP会话
         
-        return total_seconds
+        Args:
+            audio_urls: 音频URL列表
+            max_workers: 同时进行的转录任务数
+            
+        Returns:
+            {音频URL: TranscriptSegment列表}，只包含转录成功的音频，失败的记录错误
+        """
+        urls = list(dict.fromkeys(audio_urls))
+        results = {}
+        # 逐个收集结果：单个音频失败不影响其余已完成的转录
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.transcribe, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    logger.error(f"Transcription failed for {url}: {e}")
+        # 按输入顺序返回
+        return {url: results[url] for url in urls if url in results}
+
+
+def _phrase_to_segment(item: dict, _pd=parse_duration,
+                       _TS=TranscriptSegment) -> Optional[TranscriptSegment]:
+    """将单条 recognizedPhrase 转换为片段，无文本时返回 None"""
+    # _pd/_TS 通过默认参数绑定为局部名，省去热循环中的全局与属性查找
+    text = (item.get("nBest") or [{}])[0].get("display", "")
+    if not text:
+        return None
+    offset = _pd(item.get("offset", "PT0S"))
+    return _TS(offset, offset + _pd(item.get("duration", "PT0S")), text, item.get("speaker", 0))
 
 
 def segments_to_markdown(segments: List[TranscriptSegment]) -> str:
     """将转录片段转换为Markdown格式（包含说话人标识）"""
-    lines = []
-    for seg in segments:
-        timestamp = format_time(seg.start_time)
-        speaker_label = f"Speaker {seg.speaker}" if seg.speaker else ""
-        if speaker_label:
-            lines.append(f"[{timestamp}] **{speaker_label}**: {seg.text}")
+    # 预分配列表并预绑定模板，时间戳在循环内直接计算（同 format_time）
+    lines = [""] * len(segments)
+    fmt_speaker = "[{:02d}:{:02d}:{:02d}] **Speaker {}**: {}".format
+    fmt_plain = "[{:02d}:{:02d}:{:02d}] {}".format
+    for i, seg in enumerate(segments):
+        hours, rem = divmod(int(seg.start_time), 3600)
+        minutes, secs = divmod(rem, 60)
+        if seg.speaker:
+            lines[i] = fmt_speaker(hours, minutes, secs, seg.speaker, seg.text)
         else:
-            lines.append(f"[{timestamp}] {seg.text}")
+            lines[i] = fmt_plain(hours, minutes, secs, seg.text)
     return "\n\n".join(lines)
 
 
 def segments_to_json(segments: List[TranscriptSegment]) -> List[Dict]:
     """将转录片段转换为JSON格式"""
+    fmt = format_time
     return [
         {
-            "time": format_time(seg.start_time),
+            "time": fmt(seg.start_time),
             "start": seg.start_time,
             "end": seg.end_time,
             "speaker": seg.speaker,
@@ -192,6 +294,10 @@ if __name__ == '__main__':
     from dotenv import load_dotenv
     
     load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
     
     if len(sys.argv) > 1:
         key = os.getenv('AZURE_SPEECH_KEY')
@@ -201,8 +307,11 @@ if __name__ == '__main__':
             print("Missing AZURE_SPEECH_KEY or AZURE_SPEECH_REGION")
             sys.exit(1)
         
-        transcriber = Transcriber(key, region)
-        transcriber.set_language('en-US')
-        segments = transcriber.transcribe(sys.argv[1])
+        with Transcriber(key, region) as transcriber:
+            transcriber.set_language('en-US')
+            results = transcriber.transcribe_many(sys.argv[1:])
         
-        print(segments_to_markdown(segments))
+        for url, segments in results.items():
+            if len(results) > 1:
+                print(f"## {url}\n")
+            print(segments_to_markdown(segments))
@@ -1,10 +1,19 @@
 """Utility Functions - 工具函数"""
 
 import os
-import re
 from pathlib import Path
 from typing import List, Dict, Any
 from dataclasses import dataclass
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选加速依赖，缺失时回退到标准库
+    orjson = None
+    import json
+
+# 文件名非法字符与控制字符的删除表
+_SANITIZE_TABLE = str.maketrans('', '', ''.join(map(chr, range(32))) + '<>:"/\\|?*')
 
 
 def load_feeds(config_path: str) -> List[str]:
@@ -17,14 +26,9 @@ def load_feeds(config_path: str) -> List[str]:
     Returns:
         URL列表
     """
-    feeds = []
     with open(config_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            # 跳过空行和注释
-            if line and not line.startswith('#'):
-                feeds.append(line)
-    return feeds
+        # 跳过空行和注释
+        return [s for s in map(str.strip, f) if s and s[0] != '#']
 
 
 def sanitize_filename(name: str) -> str:
@@ -37,16 +41,10 @@ def sanitize_filename(name: str) -> str:
     Returns:
         安全的文件名
     """
-    # 移除非法字符
-    name = re.sub(r'[<>:"/\\|?*]', '', name)
-    # 移除控制字符
-    name = re.sub(r'[\x00-\x1f]', '', name)
-    # 限制长度
-    if len(name) > 200:
-        name = name[:200]
-    # 移除首尾空格和点
-    name = name.strip(' .')
-    return name or 'untitled'
+    # 移除非法字符和控制字符
+    name = name.translate(_SANITIZE_TABLE)
+    # 限制长度，移除首尾空格和点
+    return name[:200].strip(' .') or 'untitled'
 
 
 def ensure_dir(path: str) -> Path:
@@ -75,6 +73,7 @@ def get_output_path(base_dir: str, channel: str, date_str: str, title: str) -> P
     return output_dir / safe_title
 
 
+@lru_cache(maxsize=256)
 def format_duration(duration_str: str) -> str:
     """
     格式化时长字符串
@@ -90,10 +89,8 @@ def format_duration(duration_str: str) -> str:
     
     # 如果是纯数字，假设是秒数
     if duration_str.isdigit():
-        seconds = int(duration_str)
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
+        hours, rem = divmod(int(duration_str), 3600)
+        minutes, secs = divmod(rem, 60)
         if hours > 0:
             return f"{hours:02d}:{minutes:02d}:{secs:02d}"
         return f"{minutes:02d}:{secs:02d}"
@@ -101,6 +98,31 @@ def format_duration(duration_str: str) -> str:
     return duration_str
 
 
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    序列化为UTF-8编码的JSON（不转义非ASCII字符）
+    
+    Args:
+        obj: 待序列化对象
+        indent: 是否以2空格缩进
+        
+    Returns:
+        JSON字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_loads(data: bytes) -> Any:
+    """解析JSON字节串（有 orjson 时使用 orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 if __name__ == '__main__':
     # 测试
     print(sanitize_filename('Test: Episode "01" <Special>'))